@@ -3,22 +3,32 @@ WhatsApp Message Formatter
 Converts alerts into mobile-optimized WhatsApp messages
 """
 
-import os
-import sys
-from pathlib import Path
-from typing import List, Dict
+from typing import Callable, ClassVar, List, Dict, Tuple
 from datetime import datetime
 
-# Add project root to path
-project_root = Path(__file__).parent.parent.parent
-sys.path.insert(0, str(project_root))
+from ..intelligence.analyzer import Alert
 
-from src.intelligence.analyzer import Alert
+
+DIGEST_TIMESTAMP_FORMAT = '%d %b %Y, %I:%M %p'
 
 
 class WhatsAppMessageFormatter:
     """Formats alerts for WhatsApp (scannable, mobile-first)"""
     
+    _SEVERITY_EMOJI: ClassVar[Dict[str, str]] = {
+        'CRITICAL': '🔴',
+        'HIGH': '🟠',
+        'MEDIUM': '🟡',
+        'LOW': '🟢'
+    }
+    
+    # (alert_type, section header, bound formatter for the metric line)
+    SECTIONS: ClassVar[Tuple[Tuple[str, str, Callable[[float], str]], ...]] = (
+        ('CREDIT_RISK', "💳 *OVERDUE PAYMENTS*", "   └ Owes: ₹{:,.0f}".format),
+        ('DEAD_STOCK', "📦 *DEAD STOCK*", "   └ Not sold: {:.0f} days".format),
+        ('LOW_MARGIN', "💰 *LOW MARGIN SALES*", "   └ Margin: {:.1f}%".format),
+    )
+    
     def __init__(self, business_name: str = "Your Business"):
         self.business_name = business_name
     
@@ -30,46 +40,26 @@ class WhatsAppMessageFormatter:
         
         parts = [
             f"🚨 *{self.business_name} - Daily Alert*",
-            f"📅 {datetime.now().strftime('%d %b %Y, %I:%M %p')}",
+            f"📅 {datetime.now().strftime(DIGEST_TIMESTAMP_FORMAT)}",
             "",
             "⚠️ *ACTION REQUIRED*",
             ""
         ]
         
-        # Credit Risk Section (highest priority)
-        if 'CREDIT_RISK' in alerts_by_type:
-            parts.append("💳 *OVERDUE PAYMENTS*")
-            for i, alert in enumerate(alerts_by_type['CREDIT_RISK'][:3], 1):
-                emoji = self._severity_emoji(alert.severity)
-                parts.append(
-                    f"{emoji} {i}. {alert.entity}\n"
-                    f"   └ Owes: ₹{alert.metric_value:,.0f}\n"
-                    f"   └ {alert.action}"
-                )
-            parts.append("")
-        
-        # Dead Stock Section
-        if 'DEAD_STOCK' in alerts_by_type:
-            parts.append("📦 *DEAD STOCK*")
-            for i, alert in enumerate(alerts_by_type['DEAD_STOCK'][:3], 1):
-                emoji = self._severity_emoji(alert.severity)
-                parts.append(
-                    f"{emoji} {i}. {alert.entity}\n"
-                    f"   └ Not sold: {int(alert.metric_value)} days\n"
-                    f"   └ {alert.action}"
-                )
-            parts.append("")
-        
-        # Low Margin Section
-        if 'LOW_MARGIN' in alerts_by_type:
-            parts.append("💰 *LOW MARGIN SALES*")
-            for i, alert in enumerate(alerts_by_type['LOW_MARGIN'][:3], 1):
-                emoji = self._severity_emoji(alert.severity)
-                parts.append(
-                    f"{emoji} {i}. {alert.entity}\n"
-                    f"   └ Margin: {alert.metric_value:.1f}%\n"
+        # One block per alert type, in SECTIONS order (credit risk first)
+        for alert_type, header, format_metric in self.SECTIONS:
+            if alert_type not in alerts_by_type:
+                continue
+            parts.append(header)
+            parts.extend(
+                line
+                for i, alert in enumerate(alerts_by_type[alert_type][:3], 1)
+                for line in (
+                    f"{self._severity_emoji(alert.severity)} {i}. {alert.entity}",
+                    format_metric(alert.metric_value),
                     f"   └ {alert.action}"
                 )
+            )
             parts.append("")
         
         parts.extend([
@@ -81,12 +71,7 @@ class WhatsAppMessageFormatter:
     
     def _severity_emoji(self, severity: str) -> str:
         """Get emoji for severity level"""
-        return {
-            'CRITICAL': '🔴',
-            'HIGH': '🟠',
-            'MEDIUM': '🟡',
-            'LOW': '🟢'
-        }.get(severity, '⚪')
+        return self._SEVERITY_EMOJI.get(severity, '⚪')
     
     def _no_alerts_message(self) -> str:
         """Message when no alerts"""
@@ -97,9 +82,9 @@ class WhatsAppMessageFormatter:
         )
 
 
-# Test
+# Test (run as a module: python -m src.delivery.message_formatter)
 if __name__ == "__main__":
-    from src.intelligence.analyzer import IntelligenceAnalyzer
+    from ..intelligence.analyzer import IntelligenceAnalyzer
     from collections import defaultdict
     
     print("📱 Testing WhatsApp Message Formatter...\n")
@@ -3,13 +3,46 @@ BigQuery Loader - Upload CSV files to BigQuery
 """
 
 import os
+import csv
+import gzip
+import shutil
+import tempfile
+import time
+from pathlib import Path
 import pandas as pd
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
 from google.cloud.exceptions import NotFound
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Dict, Optional, Tuple
+from functools import lru_cache
 import yaml
 
+from .csv_cleaner import NUMERIC_FIELDS
+
+
+# BigQuery rejects gzip-compressed CSV files larger than 4GB
+GZIP_MAX_BYTES = 4 * 1024 ** 3
+
+# Fallback for BIGQUERY_MAX_BYTES_BILLED (see .env.example)
+DEFAULT_MAX_BYTES_BILLED = 10 * 1024 ** 3
+
+# How long table_exists trusts a previous get_table answer
+TABLE_EXISTS_TTL_SECONDS = 60
+
+
+
+@lru_cache(maxsize=None)
+def _get_client(project_id: Optional[str]) -> bigquery.Client:
+    """One BigQuery client per project, reused by every loader"""
+    return bigquery.Client(project=project_id)
+
+
+@lru_cache(maxsize=None)
+def _get_bqstorage_client() -> bigquery_storage.BigQueryReadClient:
+    """Storage Read API client, shared like _get_client"""
+    return bigquery_storage.BigQueryReadClient()
+
 
 class BigQueryLoader:
     """
@@ -22,7 +55,17 @@ class BigQueryLoader:
         
         self.project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
         self.dataset_raw = os.getenv('BIGQUERY_DATASET_RAW', 'raw_erp')
-        self.client = bigquery.Client(project=self.project_id)
+        self.client = _get_client(self.project_id)
+        self.bqstorage_client = _get_bqstorage_client()
+        
+        # LIMIT doesn't reduce bytes scanned in BigQuery, so cap every query
+        self.job_config = bigquery.QueryJobConfig(
+            use_query_cache=True,
+            maximum_bytes_billed=int(os.getenv('BIGQUERY_MAX_BYTES_BILLED', DEFAULT_MAX_BYTES_BILLED))
+        )
+        
+        # table_id -> (expires_at, exists); saves a get_table RPC per check
+        self._table_exists_cache: Dict[str, Tuple[float, bool]] = {}
         
         print(f"📊 BigQuery Loader initialized")
         print(f"   Project: {self.project_id}")
@@ -32,51 +75,91 @@ class BigQueryLoader:
         self, 
         csv_path: str, 
         table_name: str,
-        if_exists: str = 'replace'
+        if_exists: str = 'replace',
+        compress: bool = True
     ) -> bool:
         """
-        Load CSV file to BigQuery
+        Load CSV (or Parquet) file to BigQuery
         
         Args:
-            csv_path: Path to CSV file
+            csv_path: Path to CSV file, or a .parquet file from the cleaner
             table_name: Name of BigQuery table to create
             if_exists: 'replace' or 'append'
+            compress: Gzip the CSV upload stream (files under BigQuery's 4GB gzip limit)
             
         Returns:
             bool: Success status
         """
         try:
-            print(f"\n🔄 Loading CSV to BigQuery...")
+            is_parquet = Path(csv_path).suffix.lower() == '.parquet'
+            
+            print(f"\n🔄 Loading {'Parquet' if is_parquet else 'CSV'} to BigQuery...")
             print(f"   File: {csv_path}")
             print(f"   Table: {self.dataset_raw}.{table_name}")
             
-            # Read CSV
-            df = pd.read_csv(csv_path)
-            print(f"   Rows: {len(df)}")
-            print(f"   Columns: {list(df.columns)}")
-            
             # Define table reference
             table_id = f"{self.project_id}.{self.dataset_raw}.{table_name}"
             
-            # Configure load job
-            job_config = bigquery.LoadJobConfig(
-                write_disposition=(
-                    bigquery.WriteDisposition.WRITE_TRUNCATE 
-                    if if_exists == 'replace' 
-                    else bigquery.WriteDisposition.WRITE_APPEND
-                ),
-                autodetect=True,  # Auto-detect schema
+            write_disposition = (
+                bigquery.WriteDisposition.WRITE_TRUNCATE 
+                if if_exists == 'replace' 
+                else bigquery.WriteDisposition.WRITE_APPEND
             )
             
-            # Load data
-            job = self.client.load_table_from_dataframe(
-                df, 
-                table_id, 
-                job_config=job_config
-            )
+            # Configure load job
+            if is_parquet:
+                # Columnar, compressed and self-describing - schema comes
+                # from the file itself
+                job_config = bigquery.LoadJobConfig(
+                    source_format=bigquery.SourceFormat.PARQUET,
+                    write_disposition=write_disposition,
+                )
+            else:
+                # Read only the header - BigQuery parses the rows server-side
+                with open(csv_path, newline='', encoding='utf-8-sig') as f:
+                    columns = next(csv.reader(f), [])
+                print(f"   Columns: {columns}")
+                
+                # Explicit schema instead of autodetect: BigQuery would type
+                # YYYY-MM-DD columns as DATE, but the dbt staging models
+                # PARSE_DATE them from STRING
+                job_config = bigquery.LoadJobConfig(
+                    source_format=bigquery.SourceFormat.CSV,
+                    skip_leading_rows=1,
+                    write_disposition=write_disposition,
+                    schema=[
+                        bigquery.SchemaField(col, 'FLOAT64' if col in NUMERIC_FIELDS else 'STRING')
+                        for col in columns
+                    ],
+                )
+            
+            # Stream the file straight into the load job (no DataFrame).
+            # Gzip first when allowed - ERP CSVs compress ~5-10x, and
+            # BigQuery detects and inflates gzip CSV uploads itself
+            if compress and not is_parquet and os.path.getsize(csv_path) < GZIP_MAX_BYTES:
+                source_file = tempfile.TemporaryFile()
+                with open(csv_path, 'rb') as raw, gzip.GzipFile(
+                    fileobj=source_file, mode='wb', compresslevel=6
+                ) as gz:
+                    shutil.copyfileobj(raw, gz)
+                source_file.seek(0)
+                print(f"   Compressed: {os.path.getsize(csv_path):,} → {os.fstat(source_file.fileno()).st_size:,} bytes")
+            else:
+                source_file = open(csv_path, 'rb')
+            
+            with source_file:
+                job = self.client.load_table_from_file(
+                    source_file, 
+                    table_id, 
+                    job_config=job_config
+                )
             
             # Wait for completion
             job.result()
+            print(f"   Rows: {job.output_rows}")
+            
+            # The load may have just created the table
+            self._table_exists_cache.pop(table_id, None)
             
             print(f"✅ Data loaded successfully!")
             print(f"   Table: {table_id}")
@@ -106,21 +189,30 @@ class BigQueryLoader:
         """
         
         try:
-            df = self.client.query(query).to_dataframe()
+            df = self.client.query(query, job_config=self.job_config).to_dataframe(
+                bqstorage_client=self.bqstorage_client
+            )
             return df
         except Exception as e:
             print(f"❌ Query failed: {str(e)}")
             return pd.DataFrame()
     
     def table_exists(self, table_name: str) -> bool:
-        """Check if table exists"""
+        """Check if table exists (answers cached for TABLE_EXISTS_TTL_SECONDS)"""
         table_id = f"{self.project_id}.{self.dataset_raw}.{table_name}"
         
+        cached = self._table_exists_cache.get(table_id)
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+        
         try:
             self.client.get_table(table_id)
-            return True
+            exists = True
         except NotFound:
-            return False
+            exists = False
+        
+        self._table_exists_cache[table_id] = (time.monotonic() + TABLE_EXISTS_TTL_SECONDS, exists)
+        return exists
 
 
 # Example usage
@@ -0,0 +1,127 @@
+"""
+Test CSV cleaner
+Run this to verify the reader and validator agree with pandas on messy files
+"""
+
+import tempfile
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.ingestion import csv_cleaner
+from src.ingestion.csv_cleaner import AutomatedCSVCleaner
+
+
+UNIVERSAL_CSV = (
+    "transaction_id,transaction_date,customer_name,product_name,quantity,unit_price,total_amount,payment_due_date\n"
+    "1001,2024-01-01,Sharma Traders,Rice,2,50,100,2024-01-31\n"
+    "1002,2024-01-02,Gupta Stores,Dal,1,80,80,2024-02-01\n"
+)
+
+MISSING_REQUIRED_CSV = (
+    "transaction_id,transaction_date,customer_name,product_name,quantity,unit_price,total_amount\n"
+    "T1,2024-01-01,Sharma Traders,Rice,2,50,100\n"
+    "T2,2024-01-01,,Rice,1,50,50\n"
+    "T3,2024-01-02,NA,Dal,1,80,80\n"
+    "T4,2024-01-02,Gupta Stores,,3,20,60\n"
+)
+
+
+def test_blank_and_na_required_fields():
+    """Blank and 'NA' required fields are null and get dropped, like pd.read_csv"""
+    cleaner = AutomatedCSVCleaner()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / 'sales.csv'
+        csv_path.write_text(MISSING_REQUIRED_CSV, encoding='utf-8')
+
+        df = cleaner._read_csv(str(csv_path), encoding='utf-8')
+        expected = pd.read_csv(csv_path)
+
+    assert df.isna().sum().sum() == expected.isna().sum().sum() == 3
+
+    df = cleaner.clean_numeric(df, ['quantity', 'unit_price', 'total_amount'])
+    cleaned, report = cleaner.validate_data_quality(df)
+    assert report['rows_removed'] == 3
+    assert cleaned['transaction_id'].tolist() == ['T1']
+
+    print("✅ Blank / NA required fields test PASSED!")
+
+
+def test_dates_stay_text():
+    """Date columns reach Parquet as strings - dbt staging PARSE_DATEs them"""
+    cleaner = AutomatedCSVCleaner()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / 'sales.csv'
+        csv_path.write_text(UNIVERSAL_CSV, encoding='utf-8')
+
+        cleaner.clean_csv(str(csv_path), str(Path(tmp) / 'out.csv'), erp_system='gofrugal')
+        schema = pq.read_schema(Path(tmp) / 'out.parquet')
+
+    for field in ('transaction_id', 'transaction_date', 'payment_due_date'):
+        assert pa.types.is_string(schema.field(field).type) or pa.types.is_large_string(schema.field(field).type), \
+            f"{field} written as {schema.field(field).type}"
+
+    print("✅ Dates stay text test PASSED!")
+
+
+def test_chunked_and_in_memory_schemas_match():
+    """One input gives one Parquet schema, whichever path cleans it"""
+    cleaner = AutomatedCSVCleaner()
+
+    large_file_bytes = csv_cleaner.LARGE_FILE_BYTES
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / 'sales.csv'
+        csv_path.write_text(UNIVERSAL_CSV, encoding='utf-8')
+
+        cleaner.clean_csv(str(csv_path), str(Path(tmp) / 'small.csv'), erp_system='gofrugal')
+        csv_cleaner.LARGE_FILE_BYTES = 0
+        try:
+            cleaner.clean_csv(str(csv_path), str(Path(tmp) / 'large.csv'), erp_system='gofrugal')
+        finally:
+            csv_cleaner.LARGE_FILE_BYTES = large_file_bytes
+
+        small = pq.read_schema(Path(tmp) / 'small.parquet')
+        large = pq.read_schema(Path(tmp) / 'large.parquet')
+
+    assert small.equals(large), f"{small}\n!=\n{large}"
+    assert small.field('quantity').type == pa.float64()
+
+    print("✅ Chunked / in-memory schema test PASSED!")
+
+
+def test_chunked_encoding_fallback():
+    """A cp1252 byte past the sniffed head restarts the stream, not crash it"""
+    cleaner = AutomatedCSVCleaner()
+    header, *rows = MISSING_REQUIRED_CSV.splitlines()
+    good_row = rows[0]
+
+    # ~1.5MB of ASCII so the only non-UTF-8 byte is beyond _detect_encoding's sample
+    ascii_rows = [good_row.replace('T1', f'T{i}', 1) for i in range(25_000)]
+    body = '\n'.join([header, *ascii_rows, 'T-last,2024-01-03,Café Noir,Tea,1,30,30']) + '\n'
+
+    large_file_bytes = csv_cleaner.LARGE_FILE_BYTES
+    csv_cleaner.LARGE_FILE_BYTES = 0
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = Path(tmp) / 'sales.csv'
+            csv_path.write_bytes(body.encode('cp1252'))
+
+            cleaner.clean_csv(str(csv_path), str(Path(tmp) / 'clean.csv'), output_format='parquet')
+            cleaned = pd.read_parquet(Path(tmp) / 'clean.parquet')
+    finally:
+        csv_cleaner.LARGE_FILE_BYTES = large_file_bytes
+
+    assert len(cleaned) == 25_001
+    assert cleaned['customer_name'].iloc[-1] == 'Café Noir'
+
+    print("✅ Chunked encoding fallback test PASSED!")
+
+
+if __name__ == "__main__":
+    test_blank_and_na_required_fields()
+    test_dates_stay_text()
+    test_chunked_and_in_memory_schemas_match()
+    test_chunked_encoding_fallback()
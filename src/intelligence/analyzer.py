@@ -4,18 +4,49 @@ Reads dbt marts and generates structured business alerts
 """
 
 import os
-import pandas as pd
-from google.cloud import bigquery
+import pickle
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import Dict, List
+from typing import TYPE_CHECKING, Callable, Dict, List
 from dataclasses import dataclass
-from datetime import datetime
+from functools import lru_cache
+from datetime import date, datetime
 import logging
 
+# google-cloud-bigquery is imported where a client is built, so importing
+# Alert (e.g. from the message formatter) doesn't pull in the whole SDK
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+    from google.cloud import bigquery_storage
+
 logger = logging.getLogger(__name__)
 
-@dataclass
+# .env lives in the project root (2 levels up from this file)
+DOTENV_PATH = Path(__file__).parent.parent.parent / '.env'
+
+# Same-day mart results, reused between runs
+CACHE_DIR = Path.home() / '.cache' / 'erp-intel'
+
+# Bump when the cached payload changes shape (v2: row dicts, not DataFrames)
+CACHE_FORMAT_VERSION = 2
+
+# Severities worth alerting on
+ALERT_SEVERITIES = ('CRITICAL', 'HIGH')
+
+# Orders a mart's rows most-severe first (ties broken by the mart's metric)
+SEVERITY_RANK_SQL = (
+    "CASE alert_severity WHEN 'CRITICAL' THEN 0 WHEN 'HIGH' THEN 1 "
+    "WHEN 'MEDIUM' THEN 2 ELSE 3 END"
+)
+
+# BALANCED SAMPLING: how many alerts to keep from each category
+ALERTS_PER_TYPE = 5
+
+# Per-query scan cap when .env doesn't set BIGQUERY_MAX_BYTES_BILLED
+DEFAULT_MAX_BYTES_BILLED = 10 * 1024 ** 3
+
+@dataclass(slots=True, frozen=True)
 class Alert:
     """Structured alert object for WhatsApp"""
     alert_type: str
@@ -28,156 +59,214 @@ class Alert:
     timestamp: datetime
 
 
+@lru_cache(maxsize=None)
+def _get_client(credentials_path: str, project_id: str) -> 'bigquery.Client':
+    """
+    BigQuery client shared by every analyzer with the same credentials
+    Skips re-reading the key file and re-doing the auth/TLS handshake
+    """
+    from google.cloud import bigquery
+    
+    return bigquery.Client.from_service_account_json(
+        credentials_path, 
+        project=project_id
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_bqstorage_client(credentials_path: str) -> 'bigquery_storage.BigQueryReadClient':
+    """
+    Storage Read API client (shared like _get_client): results stream back
+    as Arrow record batches instead of paging JSON rows via tabledata.list
+    """
+    from google.cloud import bigquery_storage
+    
+    return bigquery_storage.BigQueryReadClient.from_service_account_json(
+        credentials_path
+    )
+
+
+def _rows_to_alerts(
+    rows: List[Dict],
+    alert_type: str,
+    format_message: Callable[[str, float], str],
+    now: datetime,
+    threshold: float = 0.0
+) -> List[Alert]:
+    """Build one Alert per mart row (metric_value arrives as FLOAT64 from SQL)"""
+    return [
+        Alert(
+            alert_type=alert_type,
+            severity=row['severity'],
+            entity=row['entity'],
+            metric_value=row['metric_value'],
+            threshold=threshold,
+            message=format_message(row['entity'], row['metric_value']),
+            action=row['action'],
+            timestamp=now
+        )
+        for row in rows
+    ]
+
+
 class IntelligenceAnalyzer:
     """Fetches mart data and generates actionable alerts"""
     
     def __init__(self, project_id: str, dataset: str = 'staging'):
-        # Load .env from project root (2 levels up from this file)
-        project_root = Path(__file__).parent.parent.parent
-        dotenv_path = project_root / '.env'
-        load_dotenv(dotenv_path)
+        load_dotenv(DOTENV_PATH)
         
         credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
         
-        print(f"🤖 Intelligence Analyzer initialized")
-        print(f"   Project: {project_id}")
-        print(f"   Dataset: {dataset}")
+        logger.info(f"🤖 Intelligence Analyzer initialized")
+        logger.info(f"   Project: {project_id}")
+        logger.info(f"   Dataset: {dataset}")
         
         if not credentials_path or not os.path.exists(credentials_path):
             raise FileNotFoundError(f"Credentials not found. Check .env file.")
         
-        self.client = bigquery.Client.from_service_account_json(
-            credentials_path, 
-            project=project_id
-        )
+        # Absolute path so './key.json' and '/abs/key.json' share one cached client
+        credentials_path = os.path.abspath(credentials_path)
+        self.client = _get_client(credentials_path, project_id)
+        self.bqstorage_client = _get_bqstorage_client(credentials_path)
         self.project_id = project_id
         self.dataset = dataset
+        
+        # Shared by every query: filters go in as query parameters rather
+        # than SQL text (so the statement stays identical run to run and
+        # hits BigQuery's cache), and maximum_bytes_billed makes a query
+        # that would scan far more than expected fail fast
+        from google.cloud import bigquery
+        
+        self.job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter('severity_list', 'STRING', list(ALERT_SEVERITIES)),
+                bigquery.ScalarQueryParameter('alerts_per_type', 'INT64', ALERTS_PER_TYPE),
+            ],
+            use_query_cache=True,
+            priority=bigquery.QueryPriority.INTERACTIVE,
+            maximum_bytes_billed=int(os.getenv('BIGQUERY_MAX_BYTES_BILLED', DEFAULT_MAX_BYTES_BILLED))
+        )
 
 
     
-    def fetch_bleeding_wounds(self) -> Dict[str, pd.DataFrame]:
-        """Fetch all critical mart data"""
-        queries = {
-            'dead_stock': f"""
+    def fetch_bleeding_wounds(self, use_cache: bool = True) -> Dict[str, List[Dict]]:
+        """
+        Fetch all critical mart data in a single query
+        
+        The three marts are UNION ALL'd with an alert_type discriminator and
+        each branch keeps only its top N rows by severity, so there is one
+        round-trip and nothing left to sort or trim client-side.
+        
+        Marts are rebuilt daily, so a successful result is cached on disk
+        for the rest of the day (pass use_cache=False to force a refetch).
+        """
+        cache_path = CACHE_DIR / (
+            f"{date.today().isoformat()}_{self.project_id}_{self.dataset}_v{CACHE_FORMAT_VERSION}.pkl"
+        )
+        if use_cache and cache_path.exists():
+            # The cache is only a shortcut: a bad file means a fresh query
+            try:
+                with open(cache_path, 'rb') as f:
+                    cached = pickle.load(f)
+                if isinstance(cached, dict) and all(isinstance(rows, list) for rows in cached.values()):
+                    logger.info(f"   💾 Using today's cached mart data ({cache_path.name})")
+                    return cached
+                logger.warning(f"   ⚠️  Ignoring cache {cache_path.name} in an unexpected format")
+            except (OSError, pickle.UnpicklingError, EOFError,
+                    AttributeError, ImportError, TypeError) as e:  # incompatible pickles
+                logger.warning(f"   ⚠️  Ignoring unreadable cache {cache_path.name}: {e}")
+        
+        query = f"""
+            SELECT * EXCEPT (type_position)
+            FROM (
                 SELECT 
+                    'DEAD_STOCK' as alert_type,
                     product_name as entity,
-                    days_since_last_sale as metric_value,
+                    CAST(days_since_last_sale AS FLOAT64) as metric_value,
                     alert_severity as severity,
                     recommended_action as action,
-                    estimated_value_locked
+                    ROW_NUMBER() OVER (
+                        ORDER BY {SEVERITY_RANK_SQL}, days_since_last_sale DESC
+                    ) as type_position
                 FROM `{self.project_id}.{self.dataset}.mart_dead_stock`
-                WHERE alert_severity IN ('CRITICAL', 'HIGH')
-                ORDER BY days_since_last_sale DESC
-                LIMIT 10
-            """,
-            
-            'low_margin': f"""
+                WHERE alert_severity IN UNNEST(@severity_list)
+                QUALIFY type_position <= @alerts_per_type
+                
+                UNION ALL
+                
                 SELECT 
+                    'LOW_MARGIN' as alert_type,
                     CONCAT(customer_name, ' - ', product_name) as entity,
-                    margin_percentage * 100 as metric_value,
+                    CAST(margin_percentage * 100 AS FLOAT64) as metric_value,
                     alert_severity as severity,
-                    probable_cause as action
+                    probable_cause as action,
+                    ROW_NUMBER() OVER (
+                        ORDER BY {SEVERITY_RANK_SQL}, margin_percentage ASC
+                    ) as type_position
                 FROM `{self.project_id}.{self.dataset}.mart_low_margin_sales`
-                WHERE alert_severity IN ('CRITICAL', 'HIGH')
-                ORDER BY margin_percentage ASC
-                LIMIT 10
-            """,
-            
-            'credit_risk': f"""
+                WHERE alert_severity IN UNNEST(@severity_list)
+                QUALIFY type_position <= @alerts_per_type
+                
+                UNION ALL
+                
                 SELECT 
+                    'CREDIT_RISK' as alert_type,
                     customer_name as entity,
-                    total_overdue_amount as metric_value,
+                    CAST(total_overdue_amount AS FLOAT64) as metric_value,
                     alert_severity as severity,
                     recommended_action as action,
-                    payment_score
+                    ROW_NUMBER() OVER (
+                        ORDER BY {SEVERITY_RANK_SQL}, total_overdue_amount DESC
+                    ) as type_position
                 FROM `{self.project_id}.{self.dataset}.mart_credit_risk`
-                WHERE alert_severity IN ('CRITICAL', 'HIGH')
-                ORDER BY total_overdue_amount DESC
-                LIMIT 10
-            """
-        }
+                WHERE alert_severity IN UNNEST(@severity_list)
+                QUALIFY type_position <= @alerts_per_type
+            )
+            ORDER BY alert_type, type_position
+        """
         
-        results = {}
-        for name, query in queries.items():
-            try:
-                df = self.client.query(query).to_dataframe()
-                results[name] = df
-                print(f"   📊 {name}: {len(df)} alerts")
-            except Exception as e:
-                print(f"   ❌ {name}: {str(e)}")
-                results[name] = pd.DataFrame()
+        results = {name: [] for name in ('dead_stock', 'low_margin', 'credit_risk')}
         
-        return results
-    
-    def generate_alerts(self, data: Dict[str, pd.DataFrame]) -> List[Alert]:
-        """Generate prioritized alerts from mart data"""
-        alerts = []
-    
-        # Process credit risk
-        for _, row in data['credit_risk'].iterrows():
-            alerts.append(Alert(
-                alert_type='CREDIT_RISK',
-                severity=row['severity'],
-                entity=row['entity'],
-                metric_value=float(row['metric_value']),
-                threshold=row.get('threshold', 0.0),  # ✅ Add threshold
-                message=f"{row['entity']} owes ₹{row['metric_value']:,.0f}",
-                action=row['action'],
-                timestamp=datetime.now()
-            ))
-    
-        # Process dead stock
-        for _, row in data['dead_stock'].iterrows():
-            alerts.append(Alert(
-                alert_type='DEAD_STOCK',
-                severity=row['severity'],
-                entity=row['entity'],
-                metric_value=float(row['metric_value']),
-                threshold=row.get('threshold', 0.0),  # ✅ Add threshold
-                message=f"{row['entity']} not sold for {int(row['metric_value'])} days",
-                action=row['action'],
-                timestamp=datetime.now()
-            ))
+        try:
+            # Straight from the Arrow download to plain row dicts - a
+            # DataFrame would only be built to be iterated row by row
+            rows = self.client.query(query, job_config=self.job_config).to_arrow(
+                bqstorage_client=self.bqstorage_client
+            ).to_pylist()
+        except Exception as e:
+            logger.error(f"   ❌ bleeding_wounds: {str(e)}")
+            return results
         
-        # Process low margin
-        for _, row in data['low_margin'].iterrows():
-            alerts.append(Alert(
-                alert_type='LOW_MARGIN',
-                severity=row['severity'],
-                entity=row['entity'],
-                metric_value=float(row['metric_value']),
-                threshold=row.get('threshold', 0.0),  # ✅ Add threshold
-                message=f"{row['entity']} has {row['metric_value']:.1f}% margin",
-                action=row['action'],
-                timestamp=datetime.now()
-            ))
-    
-        # BALANCED SAMPLING: Take top N from each category
-        balanced_alerts = []
+        # Split back into one row list per mart (keeps the SQL ordering)
+        for row in rows:
+            results[row.pop('alert_type').lower()].append(row)
         
-        # Define how many from each category
-        allocation = {
-            'CREDIT_RISK': 5,
-            'DEAD_STOCK': 5,
-            'LOW_MARGIN': 5
-        }
-    
-        severity_order = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3}
+        for name, mart_rows in results.items():
+            logger.info(f"   📊 {name}: {len(mart_rows)} alerts")
         
-        for alert_type, max_count in allocation.items():
-            # Get alerts of this type
-            type_alerts = [a for a in alerts if a.alert_type == alert_type]
-            
-            # Sort by severity (then by metric_value as tiebreaker)
-            type_alerts.sort(key=lambda x: (
-                severity_order[x.severity],
-                -x.metric_value  # Higher value = higher priority
-            ))
-            
-            # Take top N from this category
-            balanced_alerts.extend(type_alerts[:max_count])
+        # Write-then-rename so a crash never leaves a half-written cache;
+        # a read-only or full disk just skips caching
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(results, f)
+            tmp_path.replace(cache_path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f"   ⚠️  Could not cache mart data in {CACHE_DIR}: {e}")
         
-        return balanced_alerts
+        return results
+    
+    def generate_alerts(self, data: Dict[str, List[Dict]]) -> List[Alert]:
+        """Generate prioritized alerts from mart data (already ranked in SQL)"""
+        # One timestamp for the whole run
+        now = datetime.now()
+    
+        return (
+            _rows_to_alerts(data['credit_risk'], 'CREDIT_RISK', "{} owes ₹{:,.0f}".format, now)
+            + _rows_to_alerts(data['dead_stock'], 'DEAD_STOCK', "{} not sold for {:.0f} days".format, now)
+            + _rows_to_alerts(data['low_margin'], 'LOW_MARGIN', "{} has {:.1f}% margin".format, now)
+        )
 
 
 
@@ -193,12 +282,14 @@ def test_analyzer():
     alerts = analyzer.generate_alerts(data)
     
     print(f"\n📊 Summary: {len(alerts)} alerts found")
+    severity_emoji = {'CRITICAL': '🔴', 'HIGH': '🟠', 'MEDIUM': '🟡'}
     for i, alert in enumerate(alerts, 1):
-        emoji = {'CRITICAL': '🔴', 'HIGH': '🟠', 'MEDIUM': '🟡'}.get(alert.severity, '🟢')
+        emoji = severity_emoji.get(alert.severity, '🟢')
         print(f"{i}. {emoji} {alert.alert_type}: {alert.entity}")
         print(f"   {alert.message}")
         print(f"   Action: {alert.action}\n")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
     test_analyzer()
@@ -5,6 +5,7 @@ Runs the complete ERP Intelligence pipeline from end to end
 
 import os
 import sys
+import logging
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
@@ -18,6 +19,11 @@ from src.intelligence.analyzer import IntelligenceAnalyzer
 from src.delivery.message_formatter import WhatsAppMessageFormatter
 
 
+LOG_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+logger = logging.getLogger(__name__)
+
+
 class ERPIntelligenceOrchestrator:
     """
     Main orchestrator that runs the complete intelligence pipeline
@@ -32,13 +38,13 @@ class ERPIntelligenceOrchestrator:
         self.dataset = os.getenv('BIGQUERY_DATASET_STAGING', 'staging')
         self.business_name = os.getenv('BUSINESS_NAME', 'Your Business')
         
-        print("🚀 ERP Intelligence Orchestrator")
-        print("=" * 60)
-        print(f"⏰ Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"🏢 Business: {self.business_name}")
-        print(f"📊 Project: {self.project_id}")
-        print(f"🗄️  Dataset: {self.dataset}")
-        print("=" * 60)
+        logger.info("🚀 ERP Intelligence Orchestrator")
+        logger.info("=" * 60)
+        logger.info(f"⏰ Started at: {datetime.now().strftime(LOG_TIMESTAMP_FORMAT)}")
+        logger.info(f"🏢 Business: {self.business_name}")
+        logger.info(f"📊 Project: {self.project_id}")
+        logger.info(f"🗄️  Dataset: {self.dataset}")
+        logger.info("=" * 60)
     
     def run_pipeline(self) -> str:
         """
@@ -47,69 +53,76 @@ class ERPIntelligenceOrchestrator:
         """
         try:
             # Step 1: Fetch data from BigQuery marts
-            print("\n📊 STEP 1: Fetching data from BigQuery marts...")
+            logger.info("\n📊 STEP 1: Fetching data from BigQuery marts...")
             analyzer = IntelligenceAnalyzer(self.project_id, self.dataset)
             data = analyzer.fetch_bleeding_wounds()
             
-            total_issues = sum(len(df) for df in data.values())
-            print(f"   ✅ Found {total_issues} issues across all marts")
+            total_issues = sum(len(rows) for rows in data.values())
+            logger.info(f"   ✅ Found {total_issues} issues across all marts")
             
             # Step 2: Generate structured alerts
-            print("\n🔔 STEP 2: Generating alerts...")
+            logger.info("\n🔔 STEP 2: Generating alerts...")
             alerts = analyzer.generate_alerts(data)
-            print(f"   ✅ Generated {len(alerts)} prioritized alerts")
+            logger.info(f"   ✅ Generated {len(alerts)} prioritized alerts")
             
             if len(alerts) == 0:
-                print("   ℹ️  No critical alerts to report today")
+                logger.info("   ℹ️  No critical alerts to report today")
             
             # Step 3: Batch alerts by type
-            print("\n📦 STEP 3: Organizing alerts...")
+            logger.info("\n📦 STEP 3: Organizing alerts...")
             batched_alerts = defaultdict(list)
             for alert in alerts:
                 batched_alerts[alert.alert_type].append(alert)
             
             alert_summary = {k: len(v) for k, v in batched_alerts.items()}
-            print(f"   ✅ Alert breakdown: {alert_summary}")
+            logger.info(f"   ✅ Alert breakdown: {alert_summary}")
             
             # Step 4: Format WhatsApp message
-            print("\n📱 STEP 4: Formatting WhatsApp message...")
+            logger.info("\n📱 STEP 4: Formatting WhatsApp message...")
             formatter = WhatsAppMessageFormatter(self.business_name)
             message = formatter.format_daily_digest(dict(batched_alerts))
-            print(f"   ✅ Message ready ({len(message)} characters)")
+            logger.info(f"   ✅ Message ready ({len(message)} characters)")
             
             # Step 5: Display final message
-            print("\n" + "=" * 60)
-            print("📱 WHATSAPP MESSAGE")
-            print("=" * 60)
-            print(message)
-            print("=" * 60)
+            logger.info("\n" + "=" * 60)
+            logger.info("📱 WHATSAPP MESSAGE")
+            logger.info("=" * 60)
+            logger.info(message)
+            logger.info("=" * 60)
             
             # Summary
-            print(f"\n✅ Pipeline completed successfully!")
-            print(f"⏰ Finished at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            logger.info(f"\n✅ Pipeline completed successfully!")
+            logger.info(f"⏰ Finished at: {datetime.now().strftime(LOG_TIMESTAMP_FORMAT)}")
             
             return message
             
         except Exception as e:
-            print(f"\n❌ Pipeline failed!")
-            print(f"   Error: {str(e)}")
+            logger.error(f"\n❌ Pipeline failed!")
+            logger.error(f"   Error: {str(e)}")
             raise
 
 
 def main():
     """Entry point for orchestrator"""
+    # Plain messages, same output as before; configured once for every module
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    
     orchestrator = ERPIntelligenceOrchestrator()
     
     try:
         message = orchestrator.run_pipeline()
         
         # Future: Send via WhatsApp
-        print("\n💡 Next steps:")
-        print("   - Copy message above and send via WhatsApp")
-        print("   - Or set up Twilio to send automatically")
+        logger.info("\n💡 Next steps:")
+        logger.info("   - Copy message above and send via WhatsApp")
+        logger.info("   - Or set up Twilio to send automatically")
         
     except Exception as e:
-        print(f"\n❌ Orchestrator failed: {str(e)}")
+        logger.error(f"\n❌ Orchestrator failed: {str(e)}")
         sys.exit(1)
 
 